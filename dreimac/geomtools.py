@@ -5,9 +5,12 @@ and cross-similarity matrices, for doing "greedy permutations," and for
 some topological operations like adding cocycles and creating partitions of unity
 """
 import numpy as np
+import warnings
 import matplotlib.pyplot as plt
 import scipy.misc
 import scipy.sparse as sparse
+from scipy.spatial.distance import cdist, pdist, squareform
+from numba import njit
 
 """#########################################
    Self-Similarity And Cross-Similarity
@@ -29,9 +32,7 @@ def get_csm(X, Y):
     D : ndarray (M, N)
         An MxN Euclidean cross-similarity matrix
     """
-    C = np.sum(X**2, 1)[:, None] + np.sum(Y**2, 1)[None, :] - 2*X.dot(Y.T)
-    C[C < 0] = 0
-    return np.sqrt(C)
+    return cdist(X, Y)
 
 def get_csm_projarc(X, Y):
     """
@@ -55,13 +56,64 @@ def get_csm_projarc(X, Y):
     return D
 
 def get_ssm(X):
-    return get_csm(X, X)
+    """
+    Return the Euclidean self-similarity matrix of the N points
+    in the Nxd matrix X.  Only the upper triangle is computed
+
+    Parameters
+    ----------
+    X : ndarray (N, d)
+        A matrix holding the coordinates of N points
+    Returns
+    ------
+    D : ndarray (N, N)
+        An NxN Euclidean self-similarity matrix
+    """
+    return squareform(pdist(X))
 
 
 """#########################################
          Greedy Permutations
 #########################################"""
 
+@njit(cache=True)
+def _update_min_argmax(ds, thisds):
+    """
+    Replace ds with the elementwise minimum of ds and thisds in place,
+    and return the index of the largest entry of the result, all
+    in a single pass
+    """
+    if thisds[0] < ds[0]:
+        ds[0] = thisds[0]
+    idx = 0
+    best = ds[0]
+    for j in range(1, ds.size):
+        if thisds[j] < ds[j]:
+            ds[j] = thisds[j]
+        if ds[j] > best:
+            best = ds[j]
+            idx = j
+    return idx
+
+@njit(cache=True)
+def _greedy_perm_dm(D, M):
+    """
+    The inner loop of get_greedy_perm_dm, fusing the min update
+    and the argmax so each row of D is only walked once
+    """
+    N = D.shape[0]
+    perm = np.zeros(M, dtype=np.int64)
+    lambdas = np.zeros(M)
+    ds = np.empty(N)
+    for j in range(N):
+        ds[j] = D[0, j]
+    idx = _update_min_argmax(ds, ds)
+    for i in range(1, M):
+        perm[i] = idx
+        lambdas[i] = ds[idx]
+        idx = _update_min_argmax(ds, D[idx, :])
+    return perm, lambdas
+
 def get_greedy_perm_pc(X, M, verbose = False, csm_fn = get_csm):
     """
     A Naive O(NM) algorithm to do furthest points sampling, assuming
@@ -93,16 +145,16 @@ def get_greedy_perm_pc(X, M, verbose = False, csm_fn = get_csm):
     N = X.shape[0]
     perm = np.zeros(M, dtype=np.int64)
     lambdas = np.zeros(M)
-    ds = csm_fn(X[0, :][None, :], X).flatten()
+    ds = csm_fn(X[0:1, :], X).ravel()
     D = np.zeros((M, N))
     D[0, :] = ds
+    idx = np.argmax(ds)
     for i in range(1, M):
-        idx = np.argmax(ds)
         perm[i] = idx
         lambdas[i] = ds[idx]
-        thisds = csm_fn(X[idx, :][None, :], X).flatten()
+        thisds = csm_fn(X[idx:idx+1, :], X).ravel()
         D[i, :] = thisds
-        ds = np.minimum(ds, thisds)
+        idx = _update_min_argmax(ds, thisds)
     Y = X[perm, :]
     return {'Y':Y, 'perm':perm, 'lambdas':lambdas, 'D':D}
 
@@ -129,15 +181,7 @@ def get_greedy_perm_dm(D, M, verbose = False):
     """
     # By default, takes the first point in the permutation to be the
     # first point in the point cloud, but could be random
-    N = D.shape[0]
-    perm = np.zeros(M, dtype=np.int64)
-    lambdas = np.zeros(M)
-    ds = D[0, :]
-    for i in range(1, M):
-        idx = np.argmax(ds)
-        perm[i] = idx
-        lambdas[i] = ds[idx]
-        ds = np.minimum(ds, D[idx, :])
+    perm, lambdas = _greedy_perm_dm(D, M)
     DLandmarks = D[perm, :] 
     return {'perm':perm, 'lambdas':lambdas, 'DLandmarks':DLandmarks}
 
@@ -269,4 +313,38 @@ def partunity_exp(ds, r_cover):
     """
     return np.exp(r_cover**2/(ds**2-r_cover**2))
 
+def get_partunity(dist_land_data, r_cover, partunity_fn):
+    """
+    Create the open covering U = {U_1,..., U_{s+1}} and a partition of
+    unity subordinate to it
+    Parameters
+    ----------
+    dist_land_data: ndarray(n_landmarks, N)
+        Distances from each landmark to each data point
+    r_cover: float
+        Covering radius
+    partunity_fn: (dist_land_data, r_cover) -> phi
+        A function from the distances of each landmark to a bump function
+    Returns
+    -------
+    varphi: ndarray(n_landmarks, N)
+        The partition of unity
+        varphi_j(b) = phi_j(b)/(phi_1(b) + ... + phi_{n_landmarks}(b))
+    ball_indx: ndarray(N, dtype=int)
+        Index of the first open set each data point belongs to
+    """
+    U = dist_land_data < r_cover
+    phi = np.zeros_like(dist_land_data)
+    phi[U] = partunity_fn(dist_land_data[U], r_cover)
+    denom = np.sum(phi, 0)
+    nzero = np.sum(denom == 0)
+    if nzero > 0:
+        warnings.warn("There are %i point not covered by a landmark"%nzero)
+        denom[denom == 0] = 1
+    # phi isn't needed afterwards, so normalize it in place
+    phi /= denom[None, :]
+    varphi = phi
+    ball_indx = np.argmax(U, 0)
+    return varphi, ball_indx
+
 PARTUNITY_FNS = {'linear':partunity_linear, 'quadratic':partunity_quadratic, 'exp':partunity_exp}
@@ -1,10 +1,12 @@
 import numpy as np 
 import numpy.linalg as linalg
+import scipy.linalg
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.pyplot as plt 
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from matplotlib.widgets import Slider, RadioButtons
 from ripser import ripser
+from numba import njit
 import time
 import warnings
 from .geomtools import *
@@ -14,6 +16,45 @@ from .emcoords import *
     Projective Coordinates Utilities
 #########################################"""
 
+@njit(fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, cache=True, error_model='numpy')
+def _ppca_deflate(X, u, XOut, ay):
+    """
+    Project the columns of X onto the equator orthogonal to u and
+    rescale them back onto the sphere, using a Householder reflection
+    that takes u to the last axis.  The remaining d-1 coordinates are
+    written to XOut, and the magnitudes of the projections |u^T X|,
+    clamped to 1, are written to ay
+    """
+    d = X.shape[0]
+    N = X.shape[1]
+    v = u.copy()
+    if u[-1] >= 0:
+        v[-1] += 1
+    else:
+        v[-1] -= 1
+    c = 0.0
+    for k in range(d):
+        c += v[k]*v[k]
+    c = 2/c
+    # Walk X row by row, since its rows are contiguous
+    w = np.zeros(N)
+    y = np.zeros(N)
+    for k in range(d):
+        for j in range(N):
+            w[j] += v[k]*X[k, j]
+            y[j] += u[k]*X[k, j]
+    s = np.empty(N)
+    for j in range(N):
+        # |u^T x| can exceed 1 by roundoff, so clamp it to keep
+        # arccos and sqrt real
+        ayj = min(abs(y[j]), 1.0)
+        ay[j] = ayj
+        w[j] *= c
+        s[j] = 1/np.sqrt(1-ayj*ayj)
+    for k in range(d-1):
+        for j in range(N):
+            XOut[k, j] = (X[k, j] - w[j]*v[k])*s[j]
+
 def ppca(class_map, proj_dim, verbose=False):
     """
     Principal Projective Component Analysis (Jose Perea 2017)
@@ -37,7 +78,13 @@ def ppca(class_map, proj_dim, verbose=False):
     if verbose:
         print("Doing ppca on %i points in %i dimensions down to %i dimensions"%\
                 (class_map.shape[0], class_map.shape[1], proj_dim))
-    X = class_map.T
+    # Deflate back and forth between two buffers, so that every X is
+    # contiguous and nothing (d, N) is allocated per iteration
+    N = class_map.shape[0]
+    bufs = [np.empty(class_map.size), np.empty(class_map.size)]
+    X = bufs[0].reshape(class_map.T.shape)
+    X[:] = class_map.T
+    ay = np.zeros(N)
     variance = np.zeros(X.shape[0]-1)
 
     n_dim = class_map.shape[1]
@@ -47,17 +94,34 @@ def ppca(class_map, proj_dim, verbose=False):
     for i in range(n_dim-1):
         # Project onto an "equator"
         try:
-            _, U = linalg.eigh(X.dot(X.T))
-            U = np.fliplr(U)
+            if i == n_dim-proj_dim-2:
+                # These are the coordinates that get returned, so get all of
+                # the principal axes (only proj_dim+2 rows are left by now)
+                _, U = linalg.eigh(X.dot(X.T))
+                U = np.fliplr(U)
+            else:
+                # Otherwise only the normal u to the equator is needed, which
+                # is the eigenvector of the smallest eigenvalue
+                _, U = scipy.linalg.eigh(X.dot(X.T), subset_by_index=[0, 0])
         except:
             U = np.eye(X.shape[0])
-        variance[-i-1] = np.mean((np.pi/2-np.real(np.arccos(np.abs(U[:, -1][None, :].dot(X)))))**2)
-        Y = (U.T).dot(X)
-        y = np.array(Y[-1, :])
-        Y = Y[0:-1, :]
-        X = Y/np.sqrt(1-np.abs(y)**2)[None, :]
+        u = U[:, -1]
         if i == n_dim-proj_dim-2:
-            XRet = np.array(X)
+            # Clamp roundoff in |u^T X| as in _ppca_deflate
+            ay = np.abs(u.dot(X))
+            np.minimum(ay, 1.0, out=ay)
+            Y = (U[:, 0:-1].T).dot(X)
+            X = Y/np.sqrt(1-ay**2)[None, :]
+            XRet = X
+        else:
+            # Any basis for the complement of u will do, so use a Householder
+            # reflection taking u to the last axis instead of a full change
+            # of basis
+            bufs.reverse()
+            XOut = bufs[0][0:(X.shape[0]-1)*N].reshape((X.shape[0]-1, N))
+            _ppca_deflate(X, u, XOut, ay)
+            X = XOut
+        variance[-i-1] = np.mean((np.pi/2-np.arccos(ay))**2)
     if verbose:
         print("Elapsed time ppca: %.3g"%(time.time()-tic))
     #Return the variance and the projective coordinates
@@ -99,9 +163,11 @@ def rotmat(a, b=np.array([])):
     c = c/np.sqrt(np.sum(c**2))
     lam = np.sum(b*a)
     beta = np.sqrt(1 - np.abs(lam)**2)
-    rot = np.eye(d) - (1-lam)*(c[:, None].dot(c[None, :])) \
-                    - (1-lam)*(b[:, None].dot(b[None, :])) \
-                    + beta*(b[:, None].dot(c[None, :]) - c[:, None].dot(b[None, :]))
+    rot = np.eye(d)
+    rot -= (1-lam)*np.outer(c, c)
+    rot -= (1-lam)*np.outer(b, b)
+    bc = np.outer(b, c)
+    rot += beta*(bc - bc.T)
     return rot
 
 
@@ -315,26 +381,17 @@ class ProjectiveCoords(EMCoords):
             print("r_cover = %.3g"%r_cover)
 
         ## Step 3: Create the open covering U = {U_1,..., U_{s+1}} and partition of unity
-        U = dist_land_data < r_cover
-        phi = np.zeros_like(dist_land_data)
-        phi[U] = partunity_fn(dist_land_data[U], r_cover)
-        denom = np.sum(phi, 0)
-        nzero = np.sum(denom == 0)
-        if nzero > 0:
-            warnings.warn("There are %i point not covered by a landmark"%nzero)
-            denom[denom == 0] = 1
-        varphi = phi / denom[None, :]
-        # To each data point, associate the index of the first open set it belongs to
-        ball_indx = np.argmax(U, 0)
+        # To each data point, also associate the index of the first open set it belongs to
+        varphi, ball_indx = get_partunity(dist_land_data, r_cover, partunity_fn)
 
         ## Step 4: From U_1 to U_{s+1} - (U_1 \cup ... \cup U_s), apply classifying map
         # compute all transition functions
-        cocycle_matrix = np.ones((n_landmarks, n_landmarks))
+        # Transition functions are all +/-1, so a byte each is enough
+        cocycle_matrix = np.ones((n_landmarks, n_landmarks), dtype=np.int8)
         cocycle_matrix[cocycle[:, 0], cocycle[:, 1]] = -1
         cocycle_matrix[cocycle[:, 1], cocycle[:, 0]] = -1
         class_map = np.sqrt(varphi.T)
-        for i in range(n_data):
-            class_map[i, :] *= cocycle_matrix[ball_indx[i], :]
+        class_map *= cocycle_matrix[ball_indx, :]
         res = ppca(class_map, proj_dim, self.verbose)
         return res
 
@@ -0,0 +1,25 @@
+import warnings
+import numpy as np
+from dreimac import ppca
+
+
+class TestPPCA:
+    def test_points_on_projected_axis(self):
+        # Every point lies on a coordinate axis, so some points sit exactly
+        # on the axis that each deflation projects away
+        class_map = np.repeat(np.eye(4), [5, 4, 3, 1], axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            res = ppca(class_map, 1)
+        assert res['variance'].shape == (3,)
+        assert res['X'].shape == (13, 2)
+        assert np.isfinite(res['variance'][-1])
+
+    def test_matches_sphere_dimension(self):
+        np.random.seed(0)
+        class_map = np.random.randn(200, 6)
+        class_map /= np.sqrt(np.sum(class_map**2, 1))[:, None]
+        res = ppca(class_map, 2)
+        assert res['X'].shape == (200, 3)
+        assert np.all(np.isfinite(res['variance']))
+        assert np.allclose(np.sum(res['X']**2, 1), 1)